@@ -1,18 +1,149 @@
 """Quadrature integrations"""
 
+import functools
 import math
 
+import dask
 import dask.array as da
 import numpy as np
-from scipy.special import gammaln
+
+try:
+    from numpy.lib.stride_tricks import sliding_window_view
+except ImportError:  # NumPy < 1.20
+    sliding_window_view = None
+
+from ._quadrature_kernels import _simpson_irregular_1d, _simpson_regular_1d
 
 __all__ = ["simpson"]
 
 
 def tupleset(t, i, value):
-    lst = list(t)
-    lst[i] = value
-    return tuple(lst)
+    if i < 0:
+        i += len(t)
+    j = i + 1
+    return t[:i] + (value,) + t[j:]
+
+
+def _as_dask_array(a):
+    """Return `a` as a dask array. Dask arrays are returned unchanged,
+    small NumPy inputs are wrapped into a single chunk and other array
+    likes (cupy, xarray, ...) are left for dask to wrap.
+
+    Note: this is not a public function.
+    """
+    if isinstance(a, da.Array):
+        return a
+    if not hasattr(a, "shape") and not hasattr(a, "__array_function__"):
+        # Lists, tuples and scalars
+        a = np.asarray(a)
+    if not isinstance(a, np.ndarray):
+        return da.asarray(a)
+    return da.from_array(a, chunks=a.shape if a.ndim and a.size < 10**6 else "auto")
+
+
+def _simpson_window(n, start, stop):
+    """Return the 1-D slice covering every sample used by the composite
+    rule between `start` and `stop` on an axis of length `n`.
+    """
+    npairs = len(range(*slice(start, stop, 2).indices(n)))
+    return slice(start, start + 2 * npairs + 1)
+
+
+def _simpson_windows(a, start, stop):
+    """Return a read-only view of `a` with the last axis replaced by two
+    trailing axes of shape (npairs, 3), holding the overlapping sample
+    triples used by the composite rule. No data is copied.
+    """
+    a = a[..., _simpson_window(a.shape[-1], start, stop)]
+    npairs = (a.shape[-1] - 1) // 2
+    if sliding_window_view is not None and npairs:
+        return sliding_window_view(a, 3, axis=-1)[..., ::2, :]
+
+    step = a.strides[-1]
+    return np.lib.stride_tricks.as_strided(
+        a,
+        shape=a.shape[:-1] + (npairs, 3),
+        strides=a.strides[:-1] + (2 * step, step),
+        writeable=False,
+    )
+
+
+def _is_compiled_dtype(dtype):
+    """Whether the compiled kernels can be used for samples of `dtype`,
+    i.e. integers, float32 or float64.
+
+    Note: this is not a public function.
+    """
+    return dtype.kind in "iu" or dtype in (np.float32, np.float64)
+
+
+def _simpson_regular_gufunc(y, start, stop, dx):
+    """Composite Simpson's rule for regularly spaced samples along the
+    last axis of `y`, with signature ``(n)->()``.
+    """
+    nd = len(y.shape)
+    dtype = np.result_type(y.dtype, dx / 3.0)
+
+    # Compiled fast path for 1-D float64 results
+    if (
+        _simpson_regular_1d is not None
+        and nd == 1
+        and _is_compiled_dtype(y.dtype)
+        and dtype == np.float64
+    ):
+        window = _simpson_window(y.shape[0], start, stop)
+        return dtype.type(_simpson_regular_1d(y[window], dx))
+
+    # Weighted sum of every sample triple in a single pass over `y`. The
+    # step is applied to the reduced result, keeping the weights exact.
+    # Summing in the result dtype keeps small integers from overflowing.
+    windows = _simpson_windows(y, start, stop)
+    result = np.einsum("...ij,j->...", windows, np.array([1, 4, 1], dtype=dtype))
+    return result * (dx / 3.0)
+
+
+def _simpson_irregular_gufunc(y, x, start, stop):
+    """Composite Simpson's rule for irregularly spaced samples along the
+    last axis of `y` and `x`, with signature ``(n),(n)->()``.
+    """
+    nd = len(y.shape)
+
+    # Compiled fast path for 1-D real samples
+    if (
+        _simpson_irregular_1d is not None
+        and nd == 1
+        and _is_compiled_dtype(y.dtype)
+        and _is_compiled_dtype(x.dtype)
+    ):
+        window = _simpson_window(y.shape[0], start, stop)
+        dtype = np.result_type(y.dtype, np.float64)
+        return dtype.type(_simpson_irregular_1d(y[window], x[window]))
+
+    windows = _simpson_windows(y, start, stop)
+    y0 = windows[..., 0]
+    y1 = windows[..., 1]
+    y2 = windows[..., 2]
+
+    # Account for possibly different spacings
+    xwindows = _simpson_windows(x, start, stop)
+    h0 = (xwindows[..., 1] - xwindows[..., 0]).astype(np.float64, copy=False)
+    h1 = (xwindows[..., 2] - xwindows[..., 1]).astype(np.float64, copy=False)
+
+    hsum = h0 + h1
+    hprod = h0 * h1
+    # Guard against division by zero without allocating `out=` buffers:
+    # the inner `where` swaps zero denominators for a dummy 1.0 so no FP
+    # exception is raised, the outer `where` then picks 0.0 for them.
+    h0divh1 = np.where(h1 != 0, h0 / np.where(h1 != 0, h1, 1.0), 0.0)
+    inv_h0divh1 = np.where(h0divh1 != 0, 1.0 / np.where(h0divh1 != 0, h0divh1, 1.0), 0.0)
+    hsum_over_hprod = np.where(hprod != 0, hsum / np.where(hprod != 0, hprod, 1.0), 0.0)
+
+    tmp = (
+        hsum
+        / 6.0
+        * (y0 * (2.0 - inv_h0divh1) + y1 * (hsum * hsum_over_hprod) + y2 * (2.0 - h0divh1))
+    )
+    return np.sum(tmp, axis=-1)
 
 
 def _basic_simpson(y, start, stop, x, dx, axis):
@@ -22,6 +153,10 @@ def _basic_simpson(y, start, stop, x, dx, axis):
 
         https://en.wikipedia.org/wiki/Simpson%27s_rule
 
+    Both rules are generalized ufuncs reducing the integration axis, which
+    must be a single chunk of `y` and `x`. Each block is integrated by one
+    fused NumPy kernel.
+
     Note: this is not a public function.
 
     Args:
@@ -35,63 +170,41 @@ def _basic_simpson(y, start, stop, x, dx, axis):
     Returns:
         float: Simpson's approximation of the given integration.
     """
-    nd = len(y.shape)
-
-    # Calculate Simpson's the 3 slices for composites rules
-    slice_step = 2  # take every alternate index like 0, 2, 4 or 1, 3, 5
-    slice_all = (slice(None),) * nd
-    slice0 = tupleset(slice_all, axis, slice(start, stop, slice_step))
-    slice1 = tupleset(slice_all, axis, slice(start + 1, stop + 1, slice_step))
-    slice2 = tupleset(slice_all, axis, slice(start + 2, stop + 2, slice_step))
-
     # Regularly spaced Simpson's rule
     # See `Composite Simpson's rule` in the wiki page
     if x is None:
-        result = da.sum(y[slice0] + 4 * y[slice1] + y[slice2], axis=axis)
-        result *= dx / 3.0
+        dtype = np.result_type(y.dtype, dx / 3.0)
+        result = da.apply_gufunc(
+            _simpson_regular_gufunc,
+            "(n)->()",
+            y,
+            axis=axis,
+            output_dtypes=dtype,
+            start=start,
+            stop=stop,
+            dx=dx,
+        )
 
     # Irregularly spaced Simpson's rule
     # See `Composite Simpson's rule for irregularly spaced data`
     # in the wiki page
     else:
-        # Account for possibly different spacings
-        h = da.diff(x, axis=axis)
-
-        sl0 = tupleset(slice_all, axis, slice(start, stop, slice_step))
-        sl1 = tupleset(slice_all, axis, slice(start + 1, stop + 1, slice_step))
-
-        h0 = da.array(h[sl0], dtype="float64")
-        h1 = da.array(h[sl1], dtype="float64")
-
-        hsum = h0 + h1
-        hprod = h0 * h1
-        h0divh1 = da.true_divide(h0, h1, out=da.zeros_like(h0), where=h1 != 0)
-
-        tmp = (
-            hsum
-            / 6.0
-            * (
-                y[slice0]
-                * (
-                    2.0
-                    - da.true_divide(
-                        1.0,
-                        h0divh1,
-                        out=da.zeros_like(h0divh1),
-                        where=h0divh1 != 0,
-                    )
-                )
-                + y[slice1]
-                * (hsum * da.true_divide(hsum, hprod, out=da.zeros_like(hsum), where=hprod != 0))
-                + y[slice2] * (2.0 - h0divh1)
-            )
+        dtype = np.result_type(y.dtype, np.float64)
+        result = da.apply_gufunc(
+            _simpson_irregular_gufunc,
+            "(n),(n)->()",
+            y,
+            x,
+            axis=axis,
+            output_dtypes=dtype,
+            start=start,
+            stop=stop,
         )
-        result = da.sum(tmp, axis=axis)
 
     return result
 
 
-def simpson(y, x=None, dx=1.0, axis=-1, even="avg"):
+def simpson(y, x=None, dx=1.0, axis=-1, even="avg", optimize=False):
     """
     Integrate y(x) using samples along the given axis and the composite
     Simpson's rule. If x is None, spacing of dx is assumed.
@@ -123,6 +236,12 @@ def simpson(y, x=None, dx=1.0, axis=-1, even="avg"):
 
         'last' : Use Simpson's rule for the last N-2 intervals with a
                trapezoidal rule on the first interval.
+    optimize : bool, optional
+        If True, apply dask's graph optimizations to the result before
+        returning it, so that it is backed by an already fused graph.
+        Dask applies the same optimizations when the result is computed,
+        and they can no longer fuse with later operations once applied,
+        so this is opt-in. Default is False.
 
     Notes
     -----
@@ -150,16 +269,20 @@ def simpson(y, x=None, dx=1.0, axis=-1, even="avg"):
     1644.5
 
     """
-    y = da.asarray(y)
+    y = _as_dask_array(y)
     nd = len(y.shape)  # Number of dimensions
     N = y.shape[axis]  # Sample size along axis
 
+    # Keep the whole integration axis in a single chunk so that every block
+    # is integrated on its own, parallelism comes from the other axes.
+    y = y.rechunk({axis: -1})
+
     last_dx = dx
     first_dx = dx
     returnshape = 0
 
     if x is not None:
-        x = da.asarray(x)
+        x = _as_dask_array(x)
 
         if len(x.shape) == 1:
             shapex = [1] * nd
@@ -174,48 +297,60 @@ def simpson(y, x=None, dx=1.0, axis=-1, even="avg"):
         if x.shape[axis] != N:
             raise ValueError("If given, length of x along axis must be the same as y.")
 
+        # Match the chunks of y, the gufuncs loop over both blocks at once.
+        # Broadcast axes of length 1 stay a single chunk.
+        x = x.rechunk(tuple(c if n == m else -1 for c, n, m in zip(y.chunks, x.shape, y.shape)))
+
+    # Less than two samples span no interval, the integral is trivially zero
+    if N < 2:
+        dtype = np.result_type(y.dtype, dx / 3.0 if x is None else np.float64)
+        return da.zeros_like(y[tupleset((slice(None),) * nd, axis, 0)], dtype=dtype)
+
     # Sample size is even i.e. number of intervals is an odd number
     # Simpson's rule doesn't support that, so extra steps.
     if N % 2 == 0:
-        val = 0.0
-        result = 0.0
-
-        slice1 = (slice(None),) * nd
-        slice2 = (slice(None),) * nd
+        slice_all = (slice(None),) * nd
 
         if even not in ["avg", "last", "first"]:
             raise ValueError("Parameter 'even' must be 'avg', 'last', or 'first'.")
 
+        # The first and last estimates are independent of each other so
+        # they are built separately and only combined at the end.
+
         # Compute using Simpson's rule on first intervals
         if even in ["avg", "first"]:
-            slice1 = tupleset(slice1, axis, -1)
-            slice2 = tupleset(slice2, axis, -2)
+            slice1 = tupleset(slice_all, axis, -1)
+            slice2 = tupleset(slice_all, axis, -2)
 
             # Apply Trapezoidal rule on the last interval
             if x is not None:
                 last_dx = x[slice1] - x[slice2]
-            val += 0.5 * last_dx * (y[slice1] + y[slice2])
+            first_val = 0.5 * last_dx * (y[slice1] + y[slice2])
 
             # Apply Simpson's rule on the first N-2 intervals
-            result = _basic_simpson(y, 0, N - 3, x, dx, axis)
+            first_result = _basic_simpson(y, 0, N - 3, x, dx, axis)
 
         # Compute using Simpson's rule on last set of intervals
         if even in ["avg", "last"]:
-            slice1 = tupleset(slice1, axis, 0)
-            slice2 = tupleset(slice2, axis, 1)
+            slice1 = tupleset(slice_all, axis, 0)
+            slice2 = tupleset(slice_all, axis, 1)
 
             # Apply Trapezoidal rule on the first interval
             if x is not None:
-                first_dx = x[tuple(slice2)] - x[tuple(slice1)]
-            val += 0.5 * first_dx * (y[slice2] + y[slice1])
+                first_dx = x[slice2] - x[slice1]
+            last_val = 0.5 * first_dx * (y[slice2] + y[slice1])
 
             # Apply Simpson's rule on the last N-2 intervals
-            result += _basic_simpson(y, 1, N - 2, x, dx, axis)
+            last_result = _basic_simpson(y, 1, N - 2, x, dx, axis)
 
-        # Divide by 2 to get the average value: (first + last)/2
+        # Average both estimates: (first + last)/2
         if even == "avg":
-            val /= 2.0
-            result /= 2.0
+            val = (first_val + last_val) / 2.0
+            result = (first_result + last_result) / 2.0
+        elif even == "first":
+            val, result = first_val, first_result
+        else:
+            val, result = last_val, last_result
 
         result = result + val
 
@@ -227,6 +362,9 @@ def simpson(y, x=None, dx=1.0, axis=-1, even="avg"):
     if returnshape:
         x = x.reshape(saveshape)
 
+    if optimize:
+        (result,) = dask.optimize(result)
+
     return result
 
 
@@ -496,6 +634,63 @@ _builtincoeffs = {
 }
 
 
+# Weights and error coefficients of the built-in rules, computed once at
+# import. The weights are read-only as they are shared between calls.
+_BUILTIN_WEIGHTS = {}
+for _N, (_na, _da, _vi, _nb, _db) in _builtincoeffs.items():
+    _an = _na * np.asarray(_vi, dtype=np.float64) / _da
+    _an.setflags(write=False)
+    _BUILTIN_WEIGHTS[_N] = (_an, float(_nb) / _db)
+del _N, _na, _da, _vi, _nb, _db, _an
+
+
+@functools.lru_cache(maxsize=128)
+def _newton_cotes_cached(rn, equal):
+    """Weights and error coefficient of the Newton-Cotes rule for the sample
+    positions `rn`. Results are cached, so `rn` is passed as a tuple and
+    the weights are returned as a tuple.
+
+    Note: this is not a public function.
+
+    Args:
+        rn (tuple): Relative positions of the samples, from 0 to N.
+        equal (bool): Whether the samples are equally spaced.
+
+    Returns:
+        tuple: Weights (tuple of floats) and error coefficient (float).
+    """
+    N = len(rn) - 1
+    # The system is only (N+1)x(N+1), solve it in memory with NumPy
+    rn = np.asarray(rn)
+    if (rn[0] != 0) or (rn[-1] != N):
+        raise ValueError("The sample positions must start at 0 and end at N")
+    yi = rn / float(N)
+    ti = 2 * yi - 1
+    nvec = np.arange(N + 1)
+    # Same powers as scipy, np.vander rounds differently and the system is
+    # ill-conditioned enough to amplify it for large N
+    C = ti ** nvec[:, np.newaxis]
+    Cinv = np.linalg.inv(C)
+    # improve precision of result
+    for i in range(2):
+        Cinv = 2 * Cinv - Cinv.dot(C).dot(Cinv)
+    vec = 2.0 / (nvec[::2] + 1)
+    ai = Cinv[:, ::2].dot(vec) * (N / 2.0)
+
+    if (N % 2 == 0) and equal:
+        BN = N / (N + 3.0)
+        power = N + 2
+    else:
+        BN = N / (N + 2.0)
+        power = N + 1
+
+    BN = BN - np.dot(yi**power, ai)
+    p1 = power + 1
+    fac = power * math.log(N) - math.lgamma(p1)
+    fac = math.exp(fac)
+    return tuple(ai.tolist()), float(BN * fac)
+
+
 def newton_cotes(rn, equal=0):
     r"""
     Return weights and error coefficient for Newton-Cotes integration.
@@ -562,42 +757,20 @@ def newton_cotes(rn, equal=0):
     """
     try:
         N = len(rn) - 1
+        # The positions are a handful of numbers, check them with NumPy
+        rn = np.asarray(rn)
         if equal:
-            rn = da.arange(N + 1)
-        elif da.all(da.diff(rn) == 1):
+            rn = np.arange(N + 1)
+        elif (np.diff(rn) == 1).all():
             equal = 1
     except Exception:
         N = rn
-        rn = da.arange(N + 1)
+        rn = np.arange(N + 1)
         equal = 1
 
-    if equal and N in _builtincoeffs:
-        na, daa, vi, nb, db = _builtincoeffs[N]
-        an = na * da.array(vi, dtype=float) / daa
-        return an, float(nb) / db
-
-    if (rn[0] != 0) or (rn[-1] != N):
-        raise ValueError("The sample positions must start at 0 and end at N")
-    yi = rn / float(N)
-    ti = 2 * yi - 1
-    nvec = da.arange(N + 1)
-    C = ti ** nvec[:, np.newaxis]
-    Cinv = da.linalg.inv(C)
-    # improve precision of result
-    for i in range(2):
-        Cinv = 2 * Cinv - Cinv.dot(C).dot(Cinv)
-    vec = 2.0 / (nvec[::2] + 1)
-    ai = Cinv[:, ::2].dot(vec) * (N / 2.0)
-
-    if (N % 2 == 0) and equal:
-        BN = N / (N + 3.0)
-        power = N + 2
-    else:
-        BN = N / (N + 2.0)
-        power = N + 1
+    if equal and N in _BUILTIN_WEIGHTS:
+        an, B = _BUILTIN_WEIGHTS[N]
+        return da.from_array(an), B
 
-    BN = BN - da.dot(yi**power, ai)
-    p1 = power + 1
-    fac = power * math.log(N) - gammaln(p1)
-    fac = math.exp(fac)
-    return ai, float((BN * fac).compute())
+    an, B = _newton_cotes_cached(tuple(rn.tolist()), bool(equal))
+    return da.from_array(np.array(an)), B
@@ -0,0 +1,62 @@
+"""Compiled kernels for quadrature integrations
+
+The kernels are only available when numba is installed, otherwise they
+are set to None and the NumPy implementations are used instead.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+except ImportError:  # pragma: no cover
+    njit = None
+
+
+if njit is None:  # pragma: no cover
+    _simpson_regular_1d = None
+    _simpson_irregular_1d = None
+
+else:
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _simpson_regular_1d(y, dx):
+        """Composite Simpson's rule over every sample of a 1-D array of
+        regularly spaced samples. `y` must hold an odd number of samples.
+        """
+        n = y.shape[0]
+        acc = 0.0
+        for k in prange((n - 1) // 2):
+            i = 2 * k
+            acc += y[i] + 4.0 * y[i + 1] + y[i + 2]
+        return acc * dx / 3.0
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _simpson_irregular_1d(y, x):
+        """Composite Simpson's rule over every sample of a 1-D array of
+        irregularly spaced samples. `y` must hold an odd number of samples.
+        """
+        n = y.shape[0]
+        acc = 0.0
+        for k in prange((n - 1) // 2):
+            i = 2 * k
+            h0 = float(x[i + 1] - x[i])
+            h1 = float(x[i + 2] - x[i + 1])
+            hsum = h0 + h1
+            hprod = h0 * h1
+            h0divh1 = h0 / h1 if h1 != 0 else 0.0
+            inv_h0divh1 = 1.0 / h0divh1 if h0divh1 != 0 else 0.0
+            hsum_over_hprod = hsum / hprod if hprod != 0 else 0.0
+            acc += (
+                hsum
+                / 6.0
+                * (
+                    y[i] * (2.0 - inv_h0divh1)
+                    + y[i + 1] * (hsum * hsum_over_hprod)
+                    + y[i + 2] * (2.0 - h0divh1)
+                )
+            )
+        return acc
+
+    # Pay the compilation cost at import time rather than at first call
+    _simpson_regular_1d(np.zeros(3), 1.0)
+    _simpson_irregular_1d(np.zeros(3), np.arange(3.0))
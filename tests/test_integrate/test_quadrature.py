@@ -1,111 +1,255 @@
+import dask
 import dask.array as da
+import numpy as np
 import pytest
-from numpy.testing import assert_almost_equal, assert_equal
+from dask.distributed import Client
+from numpy.testing import assert_allclose, assert_almost_equal, assert_equal
 
-from dask_scipy.integrate import newton_cotes, romb, simpson
+import dask_scipy.integrate._quadrature_kernels as kernels
+from dask_scipy.integrate import _quadrature, newton_cotes, romb, simpson
 
+# 17 samples of y = x, shared by the simpson and romb cases
+_Y17 = np.arange(17)
 
-def test_simpson():
-    """_summary_"""
-    y = da.arange(17)
-    assert_equal(simpson(y).compute(), 128)
-    assert_equal(simpson(y, dx=0.5).compute(), 64)
-    assert_equal(simpson(y, x=da.linspace(0, 4, 17)).compute(), 32)
+# Evenly spaced grid of 17 points over [0, 4]
+_X_LINSPACE_17 = np.linspace(0, 4, 17)
+
+# Samples of y = x**2 shared by the 2-D simpson cases
+_X_2D = np.array([[1, 2, 4, 8]] * 3)
+_Y_2D = _X_2D**2
+_X_2D_MIXED = np.array([[1, 2, 4, 8], [1, 2, 4, 8], [1, 8, 16, 32]])
+_Y_2D_MIXED = _X_2D_MIXED**2
+
+# Expected integrals of the 2-D cases along axis 0 and the last axis
+_ZERO4 = np.zeros(4)
+_DEFAULT_AXIS_A = np.array([175.75] * 3)
+_ZERO_AXIS_B = np.array([0.0, 136.0, 1088.0, 8704.0])
+_DEFAULT_AXIS_B = np.array([175.75, 175.75, 11292.25])
+
+
+@pytest.fixture(scope="module")
+def client():
+    """In-process distributed client shared by every test of the module"""
+    with Client(processes=False) as c:
+        yield c
 
-    y = da.arange(4)
+
+def test_simpson(client):
+    """_summary_"""
+    r1, r2, r3, r4 = dask.compute(
+        simpson(_Y17),
+        simpson(_Y17, dx=0.5),
+        simpson(_Y17, x=_X_LINSPACE_17),
+        simpson(_Y17, optimize=True),
+    )
+    assert_allclose(r1, 128, rtol=0, atol=1e-12)
+    assert_allclose(r2, 64, rtol=0, atol=1e-12)
+    assert_allclose(r3, 32, rtol=0, atol=1e-12)
+    assert_allclose(r4, 128, rtol=0, atol=1e-12)
+
+    y = np.arange(4)
     x = 2**y
-    assert_equal(simpson(y, x=x, even="avg").compute(), 13.875)
-    assert_equal(simpson(y, x=x, even="first").compute(), 13.75)
-    assert_equal(simpson(y, x=x, even="last").compute(), 14)
+    r1, r2, r3 = dask.compute(
+        simpson(y, x=x, even="avg"),
+        simpson(y, x=x, even="first"),
+        simpson(y, x=x, even="last"),
+    )
+    assert_allclose(r1, 13.875, rtol=0, atol=1e-12)
+    assert_allclose(r2, 13.75, rtol=0, atol=1e-12)
+    assert_allclose(r3, 14, rtol=0, atol=1e-12)
 
     # Tests for checking base case
-    x = da.array([3])
-    y = da.power(x, 2)
-    assert_equal(simpson(y, x=x, axis=0).compute(), 0.0)
-    assert_equal(simpson(y, x=x, axis=-1).compute(), 0.0)
-
-    x = da.array([3, 3, 3, 3])
-    y = da.power(x, 2)
-    assert_equal(simpson(y, x=x, axis=0).compute(), 0.0)
-    assert_equal(simpson(y, x=x, axis=-1).compute(), 0.0)
-
-    x = da.array([[1, 2, 4, 8], [1, 2, 4, 8], [1, 2, 4, 8]])
-    y = da.power(x, 2)
-    zero_axis = [0.0, 0.0, 0.0, 0.0]
-    default_axis = [175.75, 175.75, 175.75]
-    assert_equal(simpson(y, x=x, axis=0).compute(), zero_axis)
-    assert_equal(simpson(y, x=x, axis=-1).compute(), default_axis)
-
-    x = da.array([[1, 2, 4, 8], [1, 2, 4, 8], [1, 8, 16, 32]])
-    y = da.power(x, 2)
-    zero_axis = [0.0, 136.0, 1088.0, 8704.0]
-    default_axis = [175.75, 175.75, 11292.25]
-    assert_equal(simpson(y, x=x, axis=0).compute(), zero_axis)
-    assert_equal(simpson(y, x=x, axis=-1).compute(), default_axis)
+    x = np.array([3])
+    y = x * x
+    r1, r2 = dask.compute(simpson(y, x=x, axis=0), simpson(y, x=x, axis=-1))
+    assert_allclose(r1, 0.0, rtol=0, atol=1e-12)
+    assert_allclose(r2, 0.0, rtol=0, atol=1e-12)
+
+    x = np.array([3, 3, 3, 3])
+    y = x * x
+    r1, r2 = dask.compute(simpson(y, x=x, axis=0), simpson(y, x=x, axis=-1))
+    assert_allclose(r1, 0.0, rtol=0, atol=1e-12)
+    assert_allclose(r2, 0.0, rtol=0, atol=1e-12)
+
+    r0, rm1 = dask.compute(
+        simpson(_Y_2D, x=_X_2D, axis=0),
+        simpson(_Y_2D, x=_X_2D, axis=-1),
+    )
+    assert_allclose(r0, _ZERO4, rtol=0, atol=1e-12)
+    assert_allclose(rm1, _DEFAULT_AXIS_A, rtol=0, atol=1e-12)
+
+    r0, rm1 = dask.compute(
+        simpson(_Y_2D_MIXED, x=_X_2D_MIXED, axis=0),
+        simpson(_Y_2D_MIXED, x=_X_2D_MIXED, axis=-1),
+    )
+    assert_allclose(r0, _ZERO_AXIS_B, rtol=0, atol=1e-12)
+    assert_allclose(rm1, _DEFAULT_AXIS_B, rtol=0, atol=1e-12)
+
+    # x and y may be chunked differently on the other axes
+    r0, rm1, rm1_dask = dask.compute(
+        simpson(da.from_array(_Y_2D_MIXED, chunks=(3, 1)), x=_X_2D_MIXED, axis=0),
+        simpson(da.from_array(_Y_2D_MIXED, chunks=(1, 4)), x=_X_2D_MIXED, axis=-1),
+        simpson(
+            da.from_array(_Y_2D_MIXED, chunks=(1, 2)),
+            x=da.from_array(_X_2D_MIXED, chunks=(2, 3)),
+            axis=-1,
+        ),
+    )
+    assert_allclose(r0, _ZERO_AXIS_B, rtol=0, atol=1e-12)
+    assert_allclose(rm1, _DEFAULT_AXIS_B, rtol=0, atol=1e-12)
+    assert_allclose(rm1_dask, _DEFAULT_AXIS_B, rtol=0, atol=1e-12)
+
+    # Small integer samples must not overflow while being summed
+    r1, r2 = dask.compute(
+        simpson(np.full((2, 9), 10**8, dtype=np.int32)),
+        simpson(np.full((2, 9), 100, dtype=np.int8)),
+    )
+    assert_allclose(r1, [8e8, 8e8], rtol=0, atol=1e-12)
+    assert_allclose(r2, [800, 800], rtol=0, atol=1e-12)
+
+    # Samples and steps the compiled kernels do not support
+    y = np.arange(5)
+    r1, r2, r3 = dask.compute(
+        simpson(y.astype(np.float16), x=y.astype(np.float16)),
+        simpson(y.astype(np.longdouble), x=y),
+        simpson(y, dx=0.5j),
+    )
+    assert_allclose(r1, 8, rtol=0, atol=1e-12)
+    assert_allclose(r2, 8, rtol=0, atol=1e-12)
+    assert_allclose(r3, 4j, rtol=0, atol=1e-12)
 
     with pytest.raises(ValueError, match="shape of x must be"):
-        simpson(y=da.random.random((5, 5, 5)), x=da.random.random((5, 5))).compute()
+        simpson(y=np.broadcast_to(0.0, (5, 5, 5)), x=np.broadcast_to(0.0, (5, 5)))
 
     with pytest.raises(ValueError, match="shape of x must be"):
-        simpson(y=da.random.random((5,)), x=da.random.random((5, 5))).compute()
+        simpson(y=np.broadcast_to(0.0, (5,)), x=np.broadcast_to(0.0, (5, 5)))
 
     with pytest.raises(ValueError, match="length of x along axis must be"):
-        simpson(y=da.arange(10), x=da.arange(15)).compute()
+        simpson(y=np.arange(10), x=np.arange(15))
 
     with pytest.raises(ValueError, match="Parameter 'even' must be"):
-        simpson(y=da.arange(10), x=da.arange(10), even="whatever").compute()
-
-
+        simpson(y=np.arange(10), x=np.arange(10), even="whatever")
+
+
+def test_simpson_optimize(client):
+    """The optimized graph holds fewer tasks and gives the same result"""
+    y = da.ones((40, 10), chunks=(10, 10))
+    plain = simpson(y)
+    optimized = simpson(y, optimize=True)
+    assert len(optimized.__dask_graph__()) < len(plain.__dask_graph__())
+    assert_allclose(optimized.compute(), plain.compute(), rtol=0, atol=1e-12)
+
+
+def test_simpson_regular(client):
+    """Regularly spaced samples of N-D arrays, with odd and even N"""
+    y = np.arange(24).reshape(2, 3, 4)
+    r1, r2, r3 = dask.compute(
+        simpson(y, axis=-1),
+        simpson(y, dx=0.5, axis=1),
+        simpson(y, axis=0),
+    )
+    # The rules are exact for linear samples, whatever the parity of N
+    assert_allclose(r1, 3 * y.mean(axis=-1), rtol=0, atol=1e-12)
+    assert_allclose(r2, y.mean(axis=1), rtol=0, atol=1e-12)
+    assert_allclose(r3, y.mean(axis=0), rtol=0, atol=1e-12)
+
+    y = np.tile(np.arange(10) ** 3, (2, 1))
+    r1, r2, r3 = dask.compute(
+        simpson(y, even="avg"),
+        simpson(y, even="first"),
+        simpson(y, even="last"),
+    )
+    assert_allclose(r1, [1642.5, 1642.5], rtol=0, atol=1e-12)
+    assert_allclose(r2, [1644.5, 1644.5], rtol=0, atol=1e-12)
+    assert_allclose(r3, [1640.5, 1640.5], rtol=0, atol=1e-12)
+
+
+@pytest.fixture(params=["dask", "numba"])
+def simpson_impl(request, monkeypatch):
+    """1-D simpson under test, either the dask implementation on its NumPy
+    path or the compiled numba kernels"""
+    if request.param == "dask":
+        monkeypatch.setattr(_quadrature, "_simpson_regular_1d", None)
+        monkeypatch.setattr(_quadrature, "_simpson_irregular_1d", None)
+        return lambda y, x=None, dx=1.0: simpson(y, x=x, dx=dx).compute()
+
+    if kernels._simpson_regular_1d is None:
+        pytest.skip("numba is not installed")
+
+    def simpson_nb(y, x=None, dx=1.0):
+        if x is None:
+            return kernels._simpson_regular_1d(y, dx)
+        return kernels._simpson_irregular_1d(y, x)
+
+    return simpson_nb
+
+
+@pytest.mark.fast
+def test_simpson_odd_samples(simpson_impl):
+    """Odd number of samples, integrated by the composite rule alone"""
+    assert_allclose(simpson_impl(_Y17), 128, rtol=0, atol=1e-12)
+    assert_allclose(simpson_impl(_Y17, dx=0.5), 64, rtol=0, atol=1e-12)
+    assert_allclose(simpson_impl(_Y17, x=_X_LINSPACE_17), 32, rtol=0, atol=1e-12)
+
+    # Irregular spacing is exact for polynomials of order 2
+    x = 2.0 ** np.arange(5)
+    assert_allclose(simpson_impl(x * x, x=x), (16.0**3 - 1.0) / 3.0, rtol=0, atol=1e-9)
+
+
+@pytest.mark.fast
 def test_romb():
-    assert_equal(romb(da.arange(17)).compute(), 128)
+    assert_equal(romb(_Y17).compute(), 128)
+
+
+@pytest.mark.fast
+@pytest.mark.parametrize(
+    "n, wts_ref, err_ref",
+    [
+        (1, np.array([0.5, 0.5]), -(1**3) / 12.0),
+        (2, np.array([1.0, 4.0, 1.0]) / 6.0, -(2**5) / 2880.0),
+        (3, np.array([1.0, 3.0, 3.0, 1.0]) / 8.0, -(3**5) / 6480.0),
+        (4, np.array([7.0, 32.0, 12.0, 32.0, 7.0]) / 90.0, -(4**7) / 1935360.0),
+    ],
+)
+def test_newton_cotes_degree(n, wts_ref, err_ref):
+    """Test the first few degrees, for evenly spaced points"""
+    wts, errcoff = newton_cotes(n, 1)
+    assert_allclose(np.asarray(wts), n * wts_ref)
+    assert_allclose(errcoff, err_ref)
 
 
+@pytest.mark.fast
 def test_newton_cotes():
     """_summary_"""
-    # Test the first few degrees, for evenly spaced points
-    n = 1
-    wts, errcoff = newton_cotes(n, 1)
-    assert_equal(wts.compute(), n * da.array([0.5, 0.5]))
-    assert_almost_equal(errcoff, -(n**3) / 12.0)
-
-    n = 2
-    wts, errcoff = newton_cotes(n, 1)
-    assert_almost_equal(wts.compute(), n * da.array([1.0, 4.0, 1.0]) / 6.0)
-    assert_almost_equal(errcoff, -(n**5) / 2880.0)
-
-    n = 3
-    wts, errcoff = newton_cotes(n, 1)
-    assert_almost_equal(wts.compute(), n * da.array([1.0, 3.0, 3.0, 1.0]) / 8.0)
-    assert_almost_equal(errcoff, -(n**5) / 6480.0)
-
-    n = 4
-    wts, errcoff = newton_cotes(n, 1)
-    assert_almost_equal(wts.compute(), n * da.array([7.0, 32.0, 12.0, 32.0, 7.0]) / 90.0)
-    assert_almost_equal(errcoff, -(n**7) / 1935360.0)
-
-    # TODO: add test witn n = da.arange(4), equal = 1 to cover `try - if equal`
-    # TODO: add test for `try - elif da.all(da.diff(rn) == 1)`
     # TODO: add tests with n = 16, 17 to cover `(N % 2 == 0) and equal` and opp
 
+    # Equally spaced positions, enforced or given as a plain list, use the
+    # built-in weights of the same order
+    wts_ref = 3 * np.array([1.0, 3.0, 3.0, 1.0]) / 8.0
+    for rn, equal in [(np.arange(4), 1), ([0, 1, 2, 3], 0)]:
+        wts, errcoff = newton_cotes(rn, equal)
+        assert_allclose(wts.compute(), wts_ref)
+        assert_allclose(errcoff, -(3**5) / 6480.0)
+
     # Test newton_cotes with points that are not evenly spaced
-    x = da.array([0.0, 1.5, 2.0])
+    x = np.array([0.0, 1.5, 2.0])
     y = x**2
     wts, errcoff = newton_cotes(x)
     exact_integral = 8.0 / 3
-    numeric_integral = da.dot(wts.compute(), y)
+    numeric_integral = float(np.dot(wts.compute(), y))
     assert_almost_equal(numeric_integral, exact_integral)
 
-    x = da.array([0.0, 1.4, 2.1, 3.0])
+    x = np.array([0.0, 1.4, 2.1, 3.0])
     y = x**2
     wts, errcoff = newton_cotes(x)
     exact_integral = 9.0
-    numeric_integral = da.dot(wts.compute(), y)
+    numeric_integral = float(np.dot(wts.compute(), y))
     assert_almost_equal(numeric_integral, exact_integral)
 
-    x = da.array([1.4, 2.1, 3.0])
+    x = np.array([1.4, 2.1, 3.0])
     with pytest.raises(ValueError, match="start at 0 and end at N"):
         wts, errcoff = newton_cotes(x)
 
-    x = da.array([0.0, 1.4, 2.1, 2.5])
+    x = np.array([0.0, 1.4, 2.1, 2.5])
     with pytest.raises(ValueError, match="start at 0 and end at N"):
         wts, errcoff = newton_cotes(x)